@@ -0,0 +1,58 @@
+"""Convert the source CSVs in data/ to the Parquet files the app reads.
+
+The CSVs live outside shiny-app/ so ``shinylive export`` only bundles Parquet.
+
+Run once whenever a CSV changes (``make parquet``) and commit the output.
+"""
+
+from pathlib import Path
+
+import polars as pl
+
+CSV_DIR = Path(__file__).parent / "data"
+PARQUET_DIR = Path(__file__).parent / "shiny-app" / "data"
+
+# Narrow types for the game-log columns the app reads. Pitcher IDs are
+# retrosheet keys (e.g. "glast001") and stay strings. Line scores look
+# numeric but hold entries like "1(10)0400000" for double-digit innings.
+# Team codes stay plain strings: Polars 1.18 (the shinylive runtime) reads
+# Enum columns back as local Categoricals that do not stack cleanly.
+GAME_SCHEMA = {
+    "Date": pl.Int32,
+    "VT": pl.String,
+    "HT": pl.String,
+    "VT Score (Line Format)": pl.String,
+    "HT Score (Line Format)": pl.String,
+    "VT Score": pl.Int16,
+    "HT Score": pl.Int16,
+    "VT Errors": pl.Int8,
+    "HT Errors": pl.Int8,
+}
+
+
+def convert(
+    name: str,
+    sort_by: str | None = None,
+    schema_overrides: dict[str, pl.DataType] | None = None,
+) -> None:
+    # Parse strictly so a schema mismatch fails here instead of becoming nulls.
+    df = pl.read_csv(CSV_DIR / f"{name}.csv", schema_overrides=schema_overrides)
+    if sort_by is not None:
+        # Keep rows ordered so each row group covers a narrow min/max range.
+        df = df.sort(sort_by, maintain_order=True)
+    df.write_parquet(
+        PARQUET_DIR / f"{name}.parquet",
+        compression="zstd",
+        statistics=True,
+        row_group_size=1024,
+    )
+
+
+if __name__ == "__main__":
+    convert(
+        "MLB2020-2024GameInfo",
+        sort_by="Date",
+        schema_overrides=GAME_SCHEMA,
+    )
+    for year in (2022, 2023, 2024):
+        convert(f"{year}era")
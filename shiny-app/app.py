@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import base64
+from functools import lru_cache
+
 import polars as pl
 
 from great_tables import GT, html
@@ -11,10 +14,42 @@ from pathlib import Path
 
 APP_DIR = Path(__file__).parent
 
-DATA_PATH = APP_DIR / "data" / "MLB2020-2024GameInfo.csv"
+DATA_PATH = APP_DIR / "data" / "MLB2020-2024GameInfo.parquet"
+
+MLB_TEAM_ABBREVIATIONS = {
+    "NYA": "NYY",
+    "NYN": "NYM",
+    "SFN": "SF",
+    "SDN": "SD",
+    "TBA": "TB",
+    "KCA": "KC",
+    "CHA": "CWS",
+    "CHN": "CHC",
+    "ANA": "LAA",
+    "LAN": "LAD",
+    "SLN": "STL",
+}
+
+
+def _team_label(team: str) -> str:
+    return MLB_TEAM_ABBREVIATIONS.get(team, team)
 
 
 # --- Utility functions ---
+# Split-bar markup. The %-fields take per-table settings; the remaining "{}"
+# slots are per-row values filled in by pl.format.
+SPLIT_BAR_SVG = """<div style="display: flex;">
+<svg width="%(width)s" height="%(height)s">
+    <rect x="{}" y="%(bar_y)s" width="{}" height="%(bar_height)s" fill="%(fill_left)s" stroke="%(stroke)s" />
+    <rect x="%(mid)s" y="%(bar_y)s" width="{}" height="%(bar_height)s" fill="%(fill_right)s" stroke="%(stroke)s" />
+    <line x1="%(mid)s" y1="0" x2="%(mid)s" y2="%(height)s" stroke="%(stroke)s" stroke-width="2"/>
+    %(text_left)s
+    %(text_right)s
+</svg>
+</div>"""
+SPLIT_BAR_LABEL = '<text x="{}" y="%(y)d" fill="%(fill)s" font-size="12" text-anchor="%(anchor)s" alignment-baseline="middle">{}</text>'
+
+
 def gt_plt_split_bar(
     gt: GT,
     columns: tuple[str, str],
@@ -36,93 +71,135 @@ def gt_plt_split_bar(
         stroke_color = "transparent"
 
     col_left, col_right = columns
-    vals_left = gt._tbl_data[col_left]
-    vals_right = gt._tbl_data[col_right]
     domain_left = domain[0] if domain else [0, 1.5]
     domain_right = domain[1] if domain else [0, 7.5]
 
-    def scale(val, domain):
+    def scale(col, domain):
         min_v, max_v = domain
         if max_v == min_v:
-            return 0.5 * width
-        return ((val - min_v) / (max_v - min_v)) * (width / 2)
-
-    def make_split_bar(val_left, val_right):
-        left_w = scale(val_left, domain_left)
-        right_w = scale(val_right, domain_right)
-
-        svg = f'''
-        <svg width="{width}" height="{height}">
-            <rect x="{width / 2 - left_w}" y="{(height - bar_height) / 2}" width="{left_w}" height="{bar_height}" fill="{fill_left}" stroke="{stroke_color}" />
-            <rect x="{width / 2}" y="{(height - bar_height) / 2}" width="{right_w}" height="{bar_height}" fill="{fill_right}" stroke="{stroke_color}" />
-            <line x1="{width / 2}" y1="0" x2="{width / 2}" y2="{height}" stroke="{stroke_color}" stroke-width="2"/>
-            {'<text x="%d" y="%d" fill="%s" font-size="12" text-anchor="start" alignment-baseline="middle">%s</text>' % (width / 2 - left_w + 5, height / 2, label_color, val_left) if show_labels else ""}
-            {'<text x="%d" y="%d" fill="%s" font-size="12" text-anchor="end" alignment-baseline="middle">%s</text>' % (width / 2 + right_w - 5, height / 2, label_color, val_right) if show_labels else ""}
-        </svg>
-        '''
-        return f'<div style="display: flex;">{svg}</div>'
-
-    for i, (v_left, v_right) in enumerate(zip(vals_left, vals_right)):
-        gt = gt.fmt(
-            lambda _vl=None, _vr=None, v_left=v_left, v_right=v_right: make_split_bar(
-                v_left, v_right
-            ),
-            columns=col_left,
-            rows=[i],
-        )
-    return gt
+            return pl.lit(0.5 * width)
+        # Fold the domain into one constant so each column is a subtract+multiply.
+        factor = (width / 2) / (max_v - min_v)
+        return (pl.col(col) - min_v) * factor
+
+    left_w = scale(col_left, domain_left)
+    right_w = scale(col_right, domain_right)
+
+    # "{}" slots are filled per row by pl.format, in the order of `args`.
+    args = [width / 2 - left_w, left_w, right_w]
+    text_left = text_right = ""
+    if show_labels:
+        text_left = SPLIT_BAR_LABEL % {"y": height / 2, "fill": label_color, "anchor": "start"}
+        text_right = SPLIT_BAR_LABEL % {"y": height / 2, "fill": label_color, "anchor": "end"}
+        args += [
+            (width / 2 - left_w + 5).cast(pl.Int64),
+            pl.col(col_left),
+            (width / 2 + right_w - 5).cast(pl.Int64),
+            pl.col(col_right),
+        ]
+
+    template = SPLIT_BAR_SVG % {
+        "width": width,
+        "height": height,
+        "mid": width / 2,
+        "bar_y": (height - bar_height) / 2,
+        "bar_height": bar_height,
+        "fill_left": fill_left,
+        "fill_right": fill_right,
+        "stroke": stroke_color,
+        "text_left": text_left,
+        "text_right": text_right,
+    }
+    bars = pl.format(template, *args)
 
+    # Render every bar in one pass, then pass the markup through a single fmt.
+    gt = gt._replace(_tbl_data=gt._tbl_data.with_columns(bars.alias(col_left)))
+    gt = gt.fmt(lambda bar: bar, columns=col_left)
+    return gt
 
-# --- Data loading ---
-@reactive.calc
-def pitcher_data():
-    YEAR = int(input.year())
-    prepend = YEAR * 10000
 
-    df = pl.read_csv(str(DATA_PATH), ignore_errors=True)
-    df = df.filter(
-        (pl.col("Date") >= (prepend + 101)) & (pl.col("Date") <= (prepend + 1231))
+@lru_cache(maxsize=None)
+def _image_tag(path: str) -> str:
+    """Embed a PNG as the same inline `<img>` markup `fmt_image()` renders."""
+    encoded = base64.b64encode(Path(path).read_bytes()).decode()
+    return (
+        '<span style="white-space:nowrap;">'
+        f'<img src="data:image/png;base64,{encoded}" style="height: 2em;vertical-align: middle;">'
+        "</span>"
     )
 
-    pitcher_games = (
-        df.select(
-            [
-                pl.col("VT").alias("Team"),
-                pl.col("VT Starting Pitcher Name").alias("Starting Pitcher"),
-                pl.col("VT Starting Pitcher ID").alias("Starting Pitcher ID"),
-                pl.col("Winning Pitcher Name").alias("Winning Pitcher"),
-                pl.col("Losing Pitcher Name").alias("Losing Pitcher"),
-                pl.col("Winning Pitcher ID").alias("Winning Pitcher ID"),
-                pl.col("Losing Pitcher ID").alias("Losing Pitcher ID"),
-                pl.col("VT Score").alias("Team Runs"),
-                pl.col("VT Errors").alias("Team Errors"),
-            ]
-        )
-        .vstack(
-            df.select(
-                [
-                    pl.col("HT").alias("Team"),
-                    pl.col("HT Starting Pitcher Name").alias("Starting Pitcher"),
-                    pl.col("HT Starting Pitcher ID").alias("Starting Pitcher ID"),
-                    pl.col("Winning Pitcher Name").alias("Winning Pitcher"),
-                    pl.col("Losing Pitcher Name").alias("Losing Pitcher"),
-                    pl.col("Winning Pitcher ID").alias("Winning Pitcher ID"),
-                    pl.col("Losing Pitcher ID").alias("Losing Pitcher ID"),
-                    pl.col("HT Score").alias("Team Runs"),
-                    pl.col("VT Errors").alias("Team Errors"),
-                ]
-            )
-        )
-        .filter(pl.col("Starting Pitcher").is_not_null())
+
+# --- Data loading ---
+GAME_COLUMNS = [
+    "Date",
+    "VT",
+    "HT",
+    "VT Starting Pitcher Name",
+    "VT Starting Pitcher ID",
+    "HT Starting Pitcher Name",
+    "HT Starting Pitcher ID",
+    "Winning Pitcher Name",
+    "Losing Pitcher Name",
+    "Winning Pitcher ID",
+    "Losing Pitcher ID",
+    "VT Score",
+    "HT Score",
+    "VT Errors",
+]
+
+
+def _read_games_by_year() -> dict[int, pl.DataFrame]:
+    games = (
+        pl.scan_parquet(DATA_PATH)
+        .select(GAME_COLUMNS)
+        .with_columns((pl.col("Date") // 10000).alias("Year"))
+        .collect()
     )
+    return {
+        year: part.drop("Year")
+        for (year,), part in games.partition_by("Year", as_dict=True).items()
+    }
+
 
+# Read the game log once; every year is served from this split.
+_GAMES_BY_YEAR = _read_games_by_year()
+
+
+# Expressions shared by every year's query; they are built once at import.
+_VT_STARTS = [
+    pl.col("VT").alias("Team"),
+    pl.col("VT Starting Pitcher Name").alias("Starting Pitcher"),
+    pl.col("VT Starting Pitcher ID").alias("Starting Pitcher ID"),
+    pl.col("Winning Pitcher Name").alias("Winning Pitcher"),
+    pl.col("Losing Pitcher Name").alias("Losing Pitcher"),
+    pl.col("Winning Pitcher ID").alias("Winning Pitcher ID"),
+    pl.col("Losing Pitcher ID").alias("Losing Pitcher ID"),
+    pl.col("VT Score").alias("Team Runs"),
+    pl.col("VT Errors").alias("Team Errors"),
+]
+_HT_STARTS = [
+    pl.col("HT").alias("Team"),
+    pl.col("HT Starting Pitcher Name").alias("Starting Pitcher"),
+    pl.col("HT Starting Pitcher ID").alias("Starting Pitcher ID"),
+    pl.col("Winning Pitcher Name").alias("Winning Pitcher"),
+    pl.col("Losing Pitcher Name").alias("Losing Pitcher"),
+    pl.col("Winning Pitcher ID").alias("Winning Pitcher ID"),
+    pl.col("Losing Pitcher ID").alias("Losing Pitcher ID"),
+    pl.col("HT Score").alias("Team Runs"),
+    pl.col("VT Errors").alias("Team Errors"),
+]
+_WON = pl.col("Starting Pitcher ID").eq_missing(pl.col("Winning Pitcher ID"))
+_LOST = pl.col("Starting Pitcher ID").eq_missing(pl.col("Losing Pitcher ID"))
+
+
+def _top_pitchers(games: pl.LazyFrame) -> pl.LazyFrame:
+    pitcher_games = pl.concat(
+        [games.select(_VT_STARTS), games.select(_HT_STARTS)], how="vertical_relaxed"
+    ).filter(pl.col("Starting Pitcher").is_not_null())
+
+    # 1 for a win, 0 for a loss, 0.5 for a no-decision.
     pitcher_games = pitcher_games.with_columns(
-        pl.when(pl.col("Starting Pitcher ID") == pl.col("Winning Pitcher ID"))
-        .then(1)
-        .when(pl.col("Starting Pitcher ID") == pl.col("Losing Pitcher ID"))
-        .then(0)
-        .otherwise(0.5)
-        .alias("WinLoss")
+        (0.5 + 0.5 * _WON.cast(pl.Int8) - 0.5 * _LOST.cast(pl.Int8)).alias("WinLoss")
     )
 
     pitcher_counts = (
@@ -130,12 +207,8 @@ def pitcher_data():
         .agg(
             [
                 pl.len().alias("Games Started"),
-                (pl.col("Starting Pitcher ID") == pl.col("Winning Pitcher ID"))
-                .sum()
-                .alias("Wins"),
-                (pl.col("Starting Pitcher ID") == pl.col("Losing Pitcher ID"))
-                .sum()
-                .alias("Losses"),
+                _WON.sum().alias("Wins"),
+                _LOST.sum().alias("Losses"),
                 pl.col("WinLoss"),
                 pl.col("Starting Pitcher").first(),
                 pl.col("Team Runs").mean().round(1),
@@ -143,57 +216,192 @@ def pitcher_data():
             ]
         )
         .with_columns(
-            pl.col("Team").map_elements(
-                lambda t: str(APP_DIR / "data" / "images" / f"{t}.png")
+            pl.format(
+                "{}/{}.png", pl.lit(str(APP_DIR / "data" / "images")), pl.col("Team")
             ).alias("Logo")
         )
     )
 
-    top_pitchers = (
+    return (
         pitcher_counts.sort(
             ["Games Started", "Starting Pitcher ID"], descending=[True, False]
         )
-        .group_by("Team")
-        .head(5)
-        .sort(["Team", "Games Started"], descending=[False, True])
+        # Top five starters per team, then keep each pitcher's busiest team.
+        .filter(
+            pl.col("Games Started").rank("ordinal", descending=True).over("Team") <= 5
+        )
+        .unique(subset=["Starting Pitcher ID"], keep="first", maintain_order=True)
         .with_columns(
-            pl.col("Starting Pitcher ID")
-            .map_elements(
-                lambda x: str(APP_DIR / "data" / "player_headshots_id" / f"{x}.png"),
-                return_dtype=pl.Utf8
-            )
-            .alias("headshot_img")
+            pl.format(
+                "{}/{}.png",
+                pl.lit(str(APP_DIR / "data" / "player_headshots_id")),
+                pl.col("Starting Pitcher ID"),
+            ).alias("headshot_img")
         )
         .with_columns(
-            (
-                pl.col("Wins").cast(pl.Int64).cast(pl.Utf8)
-                + "-"
-                + pl.col("Losses").cast(pl.Int64).cast(pl.Utf8)
-            ).alias("Record")
+            pl.format("{}-{}", pl.col("Wins"), pl.col("Losses")).alias("Record")
         )
     )
 
-    top_pitchers = (
-        top_pitchers.sort("Games Started", descending=True)
-        .group_by("Starting Pitcher ID")
-        .head(1)
-    )
 
-    era_df = pl.read_csv(str(APP_DIR / "data" / f"{YEAR}era.csv"), ignore_errors=True)
+@lru_cache(maxsize=8)
+def _load_year(year: int) -> tuple[pl.DataFrame, tuple[str, ...]]:
+    top_pitchers = _top_pitchers(_GAMES_BY_YEAR[year].lazy())
 
-    top_pitchers_with_era = top_pitchers.join(
-        era_df.select([pl.col("key_retro"), pl.col("ERA")]),
-        left_on="Starting Pitcher ID",
-        right_on="key_retro",
-        how="left",
+    era_df = pl.read_parquet(
+        APP_DIR / "data" / f"{year}era.parquet", columns=["key_retro", "ERA"]
+    )
+    era_map = dict(era_df.iter_rows())
+
+    # At most a few rows per team remain, so a map lookup beats a hash join.
+    top_pitchers_with_era = top_pitchers.with_columns(
+        pl.col("Starting Pitcher ID")
+        .replace_strict(era_map, default=None, return_dtype=pl.Float64)
+        .alias("ERA")
+    ).collect()
+
+    # Swap image paths for their encoded <img> markup once per year, so
+    # rendering the table does not re-read and re-encode every PNG.
+    top_pitchers_with_era = top_pitchers_with_era.with_columns(
+        pl.col(col).replace_strict(
+            {path: _image_tag(path) for path in top_pitchers_with_era[col].unique()}
+        )
+        for col in ("Logo", "headshot_img")
     )
 
-    return top_pitchers_with_era
+    teams = tuple(sorted(top_pitchers_with_era["Team"].unique().to_list()))
+
+    return top_pitchers_with_era, teams
+
+
+# Results depend only on the year, so share them across sessions.
+for _year in (2022, 2023, 2024):
+    _load_year(_year)
+
+
+@reactive.calc
+def pitcher_data():
+    data, _ = _load_year(int(input.year()))
+    return data
 
 
 @reactive.calc
 def team_choices():
-    return sorted(pitcher_data()["Team"].unique().to_list())
+    _, teams = _load_year(int(input.year()))
+    return teams
+
+
+@reactive.calc
+def filtered_data():
+    data = pitcher_data()
+    teams = input.teams()
+    if teams:
+        data = data.filter(pl.col("Team").is_in(teams))
+    return data
+
+
+@reactive.calc
+def sorted_data():
+    data = filtered_data().sort(input.sort_col(), descending=input.descending())
+    if not input.show_all():
+        data = data.head(14)
+    return data
+
+
+# --- Table rendering ---
+def _render_table(rows: pl.DataFrame) -> str:
+    source_note_md = """
+        <div style="margin-top:10px;">
+        Luck is defined here as a combination of a pitcher's own 
+        <span style="color:red;font-weight:bold;">team errors</span> 
+        and 
+        <span style="color:darkgreen;font-weight:bold;">run support</span> 
+        received during their starts.
+        <a href="https://github.com/juleswg23/baseball" target="_blank">View source code on GitHub</a>
+        </div>
+    """
+
+    gt = (
+        GT(rows)
+        .tab_header(
+            title="MLB Pitcher Win-Loss Records: Skill or Luck?",
+            subtitle="Win-loss records are often as influenced by 'luck' (run support and team errors) as by pitcher skill (ERA).",
+        )
+        .tab_source_note(html(source_note_md))
+        .cols_hide(
+            [
+                "Games Started",
+                "Wins",
+                "Losses",
+                "Team",
+                "Team Runs",
+                "Starting Pitcher ID",
+            ]
+        )
+        .cols_move_to_start(
+            [
+                "Logo",
+                "headshot_img",
+                "Starting Pitcher",
+                "ERA",
+                "Record",
+            ]
+        )
+        .cols_label(
+            {
+                "Starting Pitcher": "Pitcher",
+                "headshot_img": "",
+                "WinLoss": "Games Started",
+                "Logo": "",
+                "Team Errors": "Luck",
+            }
+        )
+        .fmt(lambda img: img, columns=["Logo", "headshot_img"])
+        .cols_align(
+            "center",
+            ["ERA", "Record", "Team Errors", "WinLoss"],
+        )
+        .pipe(
+            gte.gt_plt_winloss,
+            "WinLoss",
+            width=250,
+            spacing=1.5,
+            loss_color="darkorange",
+        )
+        .pipe(gte.gt_theme_538)
+        .pipe(gt_plt_split_bar, columns=("Team Errors", "Team Runs"), width=225)
+        .pipe(
+            gte.gt_color_box,
+            columns="ERA",
+            palette=["Green", "Grey", "Red"],
+            domain=[1.5, 7.5],
+        )
+    )
+    return gt.as_raw_html()
+
+
+class _TableRows:
+    """The rows of one table view, hashed and compared by their cache key only."""
+
+    __slots__ = ("key", "frame")
+
+    def __init__(self, key: tuple[int, tuple[str, ...]], frame: pl.DataFrame):
+        self.key = key
+        self.frame = frame
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _TableRows) and self.key == other.key
+
+
+# Each entry inlines every logo and headshot (~1 MB per 14 rows, ~10 MB with
+# "Show all"), and under shinylive it lives in the browser's heap, so keep
+# only the last few views.
+@lru_cache(maxsize=4)
+def _cached_table(rows: _TableRows) -> str:
+    return _render_table(rows.frame)
 
 
 # --- Shiny UI ---
@@ -233,14 +441,15 @@ with ui.sidebar(title="Sort and Filter"):
     @render.ui
     def team_selector():
         teams = team_choices()
-        display_choices = {team: MLB_TEAM_ABBREVIATIONS.get(team, team) for team in teams}
-        sorted_display_choices = dict(sorted(display_choices.items(), key=lambda item: item[1]))
+        display_choices = {
+            team: _team_label(team) for team in sorted(teams, key=_team_label)
+        }
         return ui.TagList(
             ui.input_select(
                 "teams",
                 "Teams",
-                choices=sorted_display_choices,
-                selected=teams,
+                choices=display_choices,
+                selected=list(teams),
                 multiple=True,
                 size=10,
             ),
@@ -251,97 +460,7 @@ with ui.card(full_screen=True):
 
     @render.ui
     def gt_table():
-        source_note_md = """
-            <div style="margin-top:10px;">
-            Luck is defined here as a combination of a pitcher's own 
-            <span style="color:red;font-weight:bold;">team errors</span> 
-            and 
-            <span style="color:darkgreen;font-weight:bold;">run support</span> 
-            received during their starts.
-            <a href="https://github.com/juleswg23/baseball" target="_blank">View source code on GitHub</a>
-            </div>
-        """
-
-        sort_col = input.sort_col()
-        descending = input.descending()
-        selected_teams = input.teams()
-        show_all = input.show_all()
-        data = pitcher_data()
-        if selected_teams:
-            data = data.filter(pl.col("Team").is_in(selected_teams))
-        filt = data.sort(sort_col, descending=descending)
-        if not show_all:
-            filt = filt.head(14)
-        gt = (
-            GT(filt)
-            .tab_header(
-                title="MLB Pitcher Win-Loss Records: Skill or Luck?",
-                subtitle="Win-loss records are often as influenced by 'luck' (run support and team errors) as by pitcher skill (ERA).",
-            )
-            .tab_source_note(html(source_note_md))
-            .cols_hide(
-                [
-                    "Games Started",
-                    "Wins",
-                    "Losses",
-                    "Team",
-                    "Team Runs",
-                    "Starting Pitcher ID",
-                ]
-            )
-            .cols_move_to_start(
-                [
-                    "Logo",
-                    "headshot_img",
-                    "Starting Pitcher",
-                    "ERA",
-                    "Record",
-                ]
-            )
-            .cols_label(
-                {
-                    "Starting Pitcher": "Pitcher",
-                    "headshot_img": "",
-                    "WinLoss": "Games Started",
-                    "Logo": "",
-                    "Team Errors": "Luck",
-                }
-            )
-            .fmt_image("Logo")
-            .fmt_image("headshot_img")
-            .cols_align(
-                "center",
-                ["ERA", "Record", "Team Errors", "WinLoss"],
-            )
-            .pipe(
-                gte.gt_plt_winloss,
-                "WinLoss",
-                width=250,
-                spacing=1.5,
-                loss_color="darkorange",
-            )
-            .pipe(gte.gt_theme_538)
-            .pipe(gt_plt_split_bar, columns=("Team Errors", "Team Runs"), width=225)
-            .pipe(
-                gte.gt_color_box,
-                columns="ERA",
-                palette=["Green", "Grey", "Red"],
-                domain=[1.5, 7.5],
-            )
-        )
-        return ui.HTML(gt.as_raw_html())
-
-
-MLB_TEAM_ABBREVIATIONS = {
-    "NYA": "NYY",
-    "NYN": "NYM",
-    "SFN": "SF",
-    "SDN": "SD",
-    "TBA": "TB",
-    "KCA": "KC",
-    "CHA": "CWS",
-    "CHN": "CHC",
-    "ANA": "LAA",
-    "LAN": "LAD",
-    "SLN": "STL",
-}
+        rows = sorted_data()
+        # The table only depends on which pitchers are shown and in what order.
+        key = (int(input.year()), tuple(rows["Starting Pitcher ID"].to_list()))
+        return ui.HTML(_cached_table(_TableRows(key, rows)))